@@ -27,6 +27,11 @@ Submodule `sm` supports state machines that are defined programatically,
 while submodule `decorator` supports state machines that are defined declaratively.
 It is safe to ``import *`` from either this package or from either submodule.
 
+Submodule `translator` supports the ``.pysm`` syntax, and its class `PySMTranslator` is available from this package.
+With Python 3.7 and later, the submodule is only loaded when ``StateMachines.PySMTranslator`` is first accessed.
+Call `translator.register` to import ``.pysm`` files directly, or set the environment variable ``PYSM_AUTOIMPORT``
+to have this done when this package is imported.
+
 :author: Michel Beaudouin-Lafon
 :contact: mbl@lri.fr
 :version: 0.1
@@ -35,6 +40,34 @@ It is safe to ``import *`` from either this package or from either submodule.
 """
 __docformat__ = "restructuredtext en"
 
-from sm import *
-from decorator import *
-from translator import *
+import importlib
+import os
+import sys
+
+from .sm import StateUnknown, StateAlreadyExists, TransitionBadAction, TransitionBadGuard, StateMachineFrozen, \
+    Event, State, Transition, StateMachine, enable_trace
+from .decorator import TransitionDeclarationError, TransitionBadActionName, state, transition, statemachine
+
+__all__ = ['StateUnknown', 'StateAlreadyExists', 'TransitionBadAction', 'TransitionBadGuard', 'StateMachineFrozen',
+    'Event', 'State', 'Transition', 'StateMachine', 'enable_trace',
+    'TransitionDeclarationError', 'TransitionBadActionName', 'state', 'transition', 'statemachine',
+    'PySMTranslator']
+
+# names that are loaded from their submodule on first access (see `__getattr__`)
+_lazy_names = {'PySMTranslator': 'translator'}
+
+def __getattr__(name):
+    """Load the submodule defining `name` on first access (private, see PEP 562)."""
+    if name not in _lazy_names:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + _lazy_names[name], __name__), name)
+    globals()[name] = value
+    return value
+
+if sys.version_info < (3, 7):
+    # module `__getattr__` is not supported: load the lazy names now
+    from .translator import PySMTranslator
+
+if os.environ.get('PYSM_AUTOIMPORT'):
+    from . import translator
+    translator.register()
@@ -98,74 +98,32 @@ states and transitions added to it with the `sm.StateMachine.add_state` and `sm.
 
 __docformat__ = "restructuredtext en"
 
-import sys, copy, inspect
+import logging
+import threading
 
-from sm import State, Transition, StateMachine, __DEBUG__
+from . import sm
+from .sm import State, Transition, StateMachine
 
 __all__ = ['TransitionDeclarationError', 'TransitionBadActionName', 'state', 'transition', 'statemachine']
 
-# -------- utilities --------
-
-# # Functions to find out the locals of a function.
-# # Calls the function and uses tracing tools to find out.
-# # NOTE : this is both dangerous (the function could have side effects)
-# #   and expensive: tracing is costly.
-# #
-# # Copied from http://wiki.python.org/moin/PythonDecoratorLibrary
-# # and modified by [mbl]:
-# #   - use depth of original call to test that we're getting info from the right 'return'
-# #   - use depth to avoid tracing nested calls (more efficient)
-# #   - handle exceptions
-# 
-# def _getsomelocals(function, keys, *args):
-#     """Execute a function and return its locals whose names are in keys (private).
-#     
-#     :Parameters:
-#         - `function`: The function from which to extract the locals.
-#         - `keys`: A tuple of names of locals to extract
-#         - `args`: Arguments to be passed to `function` so as to extract its locals.
-#     
-#     :return: The locals in `keys` with their values, as a dictionary.
-#     
-#     :note: Extracting the locals requires executing the function and is fairly inefficient.
-#     """
-#     func_locals = {'doc':function.__doc__}
-#     def probeFunc(frame, event, arg):
-#         if event == 'call' and len(inspect.stack()) > depth:
-#             return None
-#         elif event == 'return' and len(inspect.stack()) == depth:
-#             locals = frame.f_locals
-#             func_locals.update(dict((k,locals.get(k)) for k in keys))
-#             sys.settrace(None)
-#         elif event == 'exception' or event == 'c_exception':
-#             sys.settrace(None)
-#         return probeFunc
-#     depth = len(inspect.stack())+2
-#     sys.settrace(probeFunc)
-#     function(*args)
-#     return func_locals
-# 
-# def _getlocals(function, *args):
-#     """Execute a function and return its locals (private).
-#     
-#     :Parameters:
-#         - `function`: The function from which to extract the locals.
-#         - `args`: Arguments to be passed to `function` so as to extract its locals.
-#     
-#     :return: All the locals of `function` together with their values, as a dictionary.
-#     
-#     :note: Extracting the locals requires executing the function and is fairly inefficient.
-#     """
-#     func_locals = {'doc':function.__doc__}
-#     def probeFunc(frame, event, arg):
-#         if event == 'return' and len(inspect.stack()) == depth:
-#             func_locals.update(frame.f_locals)
-#             sys.settrace(None)
-#         return probeFunc
-#     depth = len(inspect.stack())+2
-#     sys.settrace(probeFunc)
-#     function(*args)
-#     return func_locals
+# The states whose functions are currently being executed by each thread, innermost last (private).
+# `state.__call__` pushes itself while it runs the state function, so that the
+# ``@transition``, ``@state.enter`` and ``@state.leave`` decorators can find their
+# enclosing state without inspecting the call stack.
+# Each thread has its own stack, so that threads can build state machines concurrently.
+_local = threading.local()
+
+def _state_stack():
+    """Return the state stack of the current thread (private)."""
+    try:
+        return _local.states
+    except AttributeError:
+        stack = _local.states = []
+        return stack
+
+# Declaration traces are only emitted when tracing is turned on (see `sm.enable_trace`),
+# so that declaring and instantiating state machines does not format or write anything otherwise.
+_logger = logging.getLogger(__name__)
 
 # -------- Error classes --------
 
@@ -194,8 +152,12 @@ class state(State):
     This `__call__` function, in turn, calls the function that was decorated, i.e. the function following the ``@state`` line.
     This function is supposed to define the enter/leave functions for the state and the transitions, declared using the ``@transition`` decorator.
     The ``@transition`` decorator creates transition objects and stores them in the ``transitions`` variable of the state.
-    Finally, the `__call__` function retreives and stores these enter and leave actions, if any.
+    Likewise, the ``@state.enter`` and ``@state.leave`` decorators store the enter and leave actions, if any, in the state.
+    The state function is simply called: no tracing or other introspection of its locals is needed.
     """
+    
+    # No __slots__ here: states created by the decorator mirror the ``__name__`` and ``__doc__`` of their function,
+    # and ``__doc__`` cannot be a slot of a class that has a docstring. The fields of `State` are still slots.
 
     @classmethod
     def uid(cls):
@@ -215,8 +177,8 @@ class state(State):
         
         :param func: The function defining the state.
         """
-        if __DEBUG__:
-            print "Declaring state", func.__name__
+        if sm._TRACE:
+            _logger.debug("Declaring state %s", func.__name__)
         super(state, self).__init__(func.__name__)
         #self.__dict__ = func.__dict__  # this is a bit extreme I think...
         self.__name__ = func.__name__
@@ -224,39 +186,54 @@ class state(State):
         self.func = func
         self.uid = self.uid()
 
+    def _clone(self, state_machine):
+        """Return a fresh copy of this state for `state_machine` (private).
+        
+        The copy shares the state function of this state, but has its own (empty) transitions and enter/leave actions,
+        which are declared when the copy is called. Its 'original' state is this state.
+        This is much cheaper than ``copy.deepcopy``, which would walk everything reachable from the state.
+        """
+        clone = state.__new__(type(self))
+        State.__init__(clone, self.name)
+        clone.__name__ = self.__name__
+        clone.__doc__ = self.__doc__
+        clone.func = self.func
+        clone.uid = self.uid
+        clone.original = self
+        clone.state_machine = state_machine
+        return clone
+
     # This is called when the state is called, when initializing a state machine, i.e. when a state machine is instantiated.
     def __call__(self, state_machine):
         """The wrapper function of the state decorator.
         
         Calls the original state function and extracts its enter/leave actions, if any.
         """
-        if __DEBUG__:
-            print "Initializing", self
+        if sm._TRACE:
+            _logger.debug("Initializing %s", self)
 
         # Call the state function that was decorated.  This will execute its body, including any
         # enter/leave/transition decorators contained therein.  These decorators will register their
-        # functions with this calling state instance (self).
-        self.func(state_machine)
-        
+        # functions with this calling state instance (self), which they find on top of the state stack.
+        stack = _state_stack()
+        stack.append(self)
+        try:
+            self.func(state_machine)
+        finally:
+            stack.pop()
     
     @classmethod
     def _add_enter_or_leave(cls, f, kind):
-        # Inspect the call stack to find our embedding state.
-        # We're supposed to be called by the state decorator function, which is a lambda around us.
-        # This is why we go up 3 levels in the call stack to find the state we belong to.
-        locals = sys._getframe(3).f_locals
-        my_state = None
-        if locals:
-            my_state = locals.get('self')
-        if not locals or not my_state or not isinstance(my_state, state):
+        # Find our embedding state: it is the one whose function is being executed.
+        stack = _state_stack()
+        if not stack:
             raise EnterLeaveDeclarationError("state.%s must be used within a state" % (kind))
+        my_state = stack[-1]
 
-        # import jre.debug
-        # jre.debug.interact()
         if not callable(f):
-            setattr(my_state, kind, None)
+            setattr(my_state, '_%s_cb' % kind, None)
         else:
-            setattr(my_state, kind, f)
+            setattr(my_state, '_%s_cb' % kind, f)
         
         return f
     
@@ -278,6 +255,8 @@ class transition(Transition):
     This is meant to facilitate programming (inventing transition names is often difficult) and to avoid polluting the namespace. 
     We also check that the ``@transition`` decorator is used only inside the declaration of a state.
     """
+    
+    __slots__ = ()
 
     # This is called when @transition is encountered, i.e. when a state machine is initialized
     # (The state machine calls each state in turn, and each state function contains its transitions)
@@ -311,25 +290,21 @@ class transition(Transition):
         
         :param func: the function being decorated, i.e. the transition action.
         """
-        if __DEBUG__:
-            print "  Declaring", self
+        if sm._TRACE:
+            _logger.debug("  Declaring %s", self)
 
         # func must be called 'action': 
         if func.__name__ != 'action':
-            raise TransitionBadActionName, "The function '%s' declared with the @transition decorator must be called 'action'." % func.__name__
+            raise TransitionBadActionName("The function %r declared with the @transition decorator must be called 'action'." % func.__name__)
 
         self.action = func
 
-        # we're supposed to be called by the state decorator function.
-        # This is why we go up 2 levels in the call stack to find the state we belong to.
-        locals = sys._getframe(2).f_locals
-        my_state = None
-        if locals:
-            my_state = locals.get('self')
-        if not locals or not my_state or not isinstance(my_state, state):
-            raise TransitionDeclarationError, "A transition must be declared within a state"
-        my_state.transitions.append(self)
-        self.state = my_state
+        # we're supposed to be called while the state decorator function is running,
+        # in which case the state we belong to is on top of the state stack.
+        stack = _state_stack()
+        if not stack:
+            raise TransitionDeclarationError("A transition must be declared within a state")
+        stack[-1]._append_transition(self)
 
         return func
 
@@ -339,6 +314,19 @@ class statemachine(StateMachine):
     Like regular state machines, additional states and transitions can be added with the `sm.StateMachine.add_state` and `sm.StateMachine.add_transition` methods.
     """
     
+    @classmethod
+    def _sm_template(cls):
+        """Return the states declared with ``@state`` in this class, in declaration order (private).
+        
+        The class dictionary is scanned the first time the class is instantiated, and the result is cached in the class
+        so that further instantiations do not have to look up the declared states or the start state again.
+        """
+        template = cls.__dict__.get('_sm_declared_states')
+        if template is None:
+            template = tuple(sorted([s for s in cls.__dict__.values() if isinstance(s, state)], key=lambda s: s.uid))
+            cls._sm_declared_states = template
+        return template
+    
     def __init__(self, active = True, call_actions = False):
         """Initialize a new state machine.
         
@@ -348,41 +336,35 @@ class statemachine(StateMachine):
         """
         super(statemachine, self).__init__(active, call_actions)
         
-        # go through the declared states and call them.
+        # go through the declared states, in declaration order, and call them.
         # this will call state.__call__ which will initialize the state.
-        # also initialize start_state (and current_state) with the lowest numbered state
-        start_id = 0
-        for my_name, my_state in self.__class__.__dict__.items():
-            if isinstance(my_state, state) and callable(my_state):
-                # we make a copy of the state otherwise it would be shared among instances of the state machine class.
-                # we keep a link from the copy to the original so that find_state can return the copy when given the id of the original.
-                original = my_state
-                my_state = copy.deepcopy(original)
-                my_state.original = original
-                my_state.state_machine = self
-                
-                # call the state, which will declare the enter/leave actions and the transitions
-                my_state(self)
-                
-                # add it to the list of states
-                self._sm_states.append(my_state)
-                
-                # make it the start state if needed
-                if not self._sm_start_state or my_state.uid < start_id:
-                    start_id = my_state.uid
-                    self._sm_start_state = my_state
+        # the first declared state is the start state (and current state)
+        for original in self._sm_template():
+            # we make a copy of the state otherwise it would be shared among instances of the state machine class.
+            # the copy keeps a link to the original so that find_state can return the copy when given the id of the original.
+            my_state = original._clone(self)
+            
+            # call the state, which will declare the enter/leave actions and the transitions
+            my_state(self)
+            
+            # add it to the list of states
+            self._append_state(my_state)
+        
+        if self._sm_states:
+            self._sm_start_state = self._sm_states[0]
         
         # now fix the destination states of the transitions so they point to the copies instead of the originals:
         for my_state in self._sm_states:
             for transition in my_state.transitions:
                 if transition.to_state:
-                    transition.to_state = self.find_state(transition.to_state)
+                    transition.to_state = self._sm_states_by_original.get(id(transition.to_state.original))
         
         # set initial state
         self._sm_current_state = self._sm_start_state
         
-        if self._sm_active and self._sm_call_actions_from_reset:
+        if self._sm_active and self._sm_call_actions_on_reset:
             # temporarily setting active to False allows the enter action to distinguish from normal calls
             self._sm_active = False
-            self._sm_current_state.enter()
+            if self._sm_current_state._enter_cb:
+                self._sm_current_state._enter_cb()
             self._sm_active = True
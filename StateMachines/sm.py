@@ -70,16 +70,39 @@ that specifies the event type, additional arguments, optinal guard, and optional
 
     [Should include a simple example here with a drawing]
 
-:group Exceptions: StateUnknown, StateAlreadyExists, TransitionBadAction, TransitionBadGuard
+:group Exceptions: StateUnknown, StateAlreadyExists, TransitionBadAction, TransitionBadGuard, StateMachineFrozen
 
 """
 __docformat__ = "restructuredtext en"
 
-__all__ = ['StateUnknown', 'StateAlreadyExists', 'TransitionBadAction', 'TransitionBadGuard',
-    'Event', 'State', 'Transition', 'StateMachine']
+import logging
+from collections import deque
 
-__debugsm__ = False
-__DEBUG__ = __debug__ and __debugsm__
+__all__ = ['StateUnknown', 'StateAlreadyExists', 'TransitionBadAction', 'TransitionBadGuard', 'StateMachineFrozen',
+    'Event', 'State', 'Transition', 'StateMachine', 'enable_trace']
+
+# -------- Tracing --------
+
+# When True, event processing (and the declaration of state machines, see module `decorator`) is traced.
+# Traces are logged at debug level; when False, tracing costs a single test of this flag.
+_TRACE = False
+
+_logger = logging.getLogger(__name__)
+
+def enable_trace(enable=True):
+    """Turn the tracing of state machines on or off.
+    
+    :param enable: Whether to trace the processing of events and the declaration of state machines.
+    
+    Traces are logged at debug level by the loggers of this module and of module `decorator`,
+    so logging must also be configured for them to be output, e.g. with ``logging.basicConfig(level=logging.DEBUG)``.
+    """
+    global _TRACE
+    _TRACE = enable
+
+def _trace(message, *args):
+    """Log a trace message (private, only call when `_TRACE` is True)."""
+    _logger.debug(message, *args)
 
 # -------- Error classes --------
 
@@ -95,6 +118,9 @@ class TransitionBadAction(Exception):
 class TransitionBadGuard(Exception):
     """Signals that the guard specified for a transition is not callable."""
 
+class StateMachineFrozen(Exception):
+    """Signals that a state or transition is added to a state machine that was frozen (see `StateMachine.freeze`)."""
+
 # -------- Event class --------
 
 class Event(object):
@@ -102,18 +128,34 @@ class Event(object):
     
     Applications should define subclasses of `Event` to implement application-specific types of events.
     
-    In fact, state machines only require events to have a `type` field and a `match` method so in fact
-    events do not absolutely need to be instances of `Event`.
+    Transitions are matched against the class of events, and then their `match` method.
+    Since the class identifies the type of the event, subclasses do not need to call `__init__` to set the `type` field:
+    they can rather name their events with the class attribute `event_name`, which costs nothing per event.
     
-    :ivar type: The type of the event. This field is compared with the type of event expected by each transition.
+    Subclasses can declare ``__slots__`` to keep their events small, since many of them are created
+    for high-frequency input such as mouse moves.
+    `Event` itself has empty ``__slots__``, so that subclasses can also derive from classes with their own instance layout,
+    such as tuples or the event classes of a toolkit.
+    A subclass whose events set `type` with `__init__` must then have a ``type`` slot, or no ``__slots__``.
+    
+    :ivar type: The type of the event, if set by `__init__`, otherwise None. It is not used by state machines.
+    :cvar event_name: A name for the events of this class, e.g. ``'Press'``, or None.
     """
-    def __init__(self, type):
+    
+    __slots__ = ()
+    
+    type = None
+    event_name = None
+    
+    def __init__(self, type=None):
         """Initialize an event. 
         
         :param type: The type of the event. Can be any object but normally subclasses use the event class object itself, e.g. ``ButtonPress``.  NOTE:  This type is not currently used -JRE 2010-01-22
+            If None, the `type` field is not set, so that subclasses that use `event_name` instead need not have a ``type`` slot.
         """
         super(Event, self).__init__()
-        self.type = type
+        if type is not None:
+            self.type = type
     
     def match(self, transition):
         """Return True if this event matches the transition.
@@ -125,9 +167,26 @@ class Event(object):
         Subclasses should redefine this method to properly interpret the transition's ``args`` and ``kwargs`` fields
         and refine the match, e.g. to distinguish among several buttons for a ``ButtonPress`` event.
         By default, i.e. unless it is redefined, match always returns True.
+        
+        Since the default method always returns True, it is not even called for events whose class does not redefine it.
+        For this reason, ``match`` must be redefined in the class, not assigned to individual events.
         """
         return True
 
+_default_match = Event.__dict__['match']
+_redefines_match = {}   # cache of `_event_class_redefines_match`
+
+def _event_class_redefines_match(event_class):
+    """Return True if the class of an event redefines `Event.match` (private).
+    
+    The result is cached for each class.
+    """
+    redefines = _redefines_match.get(event_class)
+    if redefines is None:
+        match = getattr(event_class, 'match', None)
+        redefines = _redefines_match[event_class] = getattr(match, '__func__', match) is not _default_match
+    return redefines
+
 # -------- State and Transition classes --------
 
 
@@ -136,8 +195,12 @@ class State(object):
     
     This class should not be directly instantiated nor its methods called directly by the application.
     States are created either with the `StateMachine.add_state` method or the ``@state`` decorator in module `decorator`.
+    
+    States use ``__slots__`` to keep them small: the application cannot add its own attributes to them.
     """
     
+    __slots__ = ('name', '_enter_cb', '_leave_cb', 'transitions', '_candidates', 'original', 'state_machine')
+    
     def __init__(self, name, enter=None, leave=None):
         """Initialize a state.
         
@@ -147,9 +210,10 @@ class State(object):
         """
         super(State, self).__init__()
         self.name = name
-        self.enter = enter
-        self.leave = leave
+        self._enter_cb = enter      # the enter action, if any
+        self._leave_cb = leave      # the leave action, if any
         self.transitions = []
+        self._candidates = {}           # cache of `_find_candidates` for each event class
         self.original = self        # used by the @state decorator pattern
         self.state_machine = None   # the state machine this state is in
     
@@ -165,37 +229,75 @@ class State(object):
         Applications should either use `StateMachine.add_transition` or the ``@transition`` decorator to create transitions.
         """
         transition = Transition(event_type, *args, **kwargs)
+        self._append_transition(transition)
+        return transition
+    
+    def _append_transition(self, transition):
+        """Add an existing transition to this state (private).
+        
+        :param transition: The transition, which must not belong to another state.
+        
+        The transition is also added to the list of all the transitions of the state machine, if any.
+        """
         transition.state = self
         self.transitions.append(transition)
-        return transition
+        self._candidates.clear()
+        if self.state_machine is not None:
+            self.state_machine._sm_all_transitions.append(transition)
+            self.state_machine._sm_listings.clear()
+    
+    def _find_candidates(self, event_class):
+        """Return the transitions that may match events of class `event_class`, in declaration order (private).
+        
+        These are the transitions whose event type is matched by `issubclass`, as ``isinstance`` would match the events,
+        so that abstract base classes, classes that redefine ``__subclasscheck__`` and tuples of types work as event types.
+        """
+        return tuple([t for t in self.transitions if issubclass(event_class, t.event_type)])
     
     def enter(self):
         """Call the state's enter action, if any."""
-        if self.enter:
-            self.enter()
+        if self._enter_cb:
+            self._enter_cb()
     
     def leave(self):
         """Call the state's leave action, if any."""
-        if self.leave:
-            self.leave()
+        if self._leave_cb:
+            self._leave_cb()
     
     def get_transition(self, event):
         """Return the first transition that matches `event` and whose guard (if any) evaluates to True, None otherwise.
         
         :param event: The event to be matched.
         
-        For each transition, first the event type is tested, if it matches then the `Event.match` method is called,
+        For each transition, first the event type is tested, if it matches then the `Event.match` method is called
+        (unless it is the default method, which always returns True),
         if it returns True and the transition has a guard, then the guard is evaluated.
+        
+        Transitions are looked up by the class of the event (see `_find_candidates`),
+        so that transitions on other event types are not even considered.
         """
-        for transition in self.transitions:
-            if __DEBUG__:
-                print 'trying ', transition
-            if isinstance(event, transition.event_type) and event.match(transition):
-                if callable(transition.guard):
-                    if transition.guard(event):
-                        return transition
-                    continue
-                return transition
+        event_class = type(event)
+        candidates = self._candidates.get(event_class)
+        if candidates is None:
+            candidates = self._candidates[event_class] = self._find_candidates(event_class)
+        if not candidates:
+            return None
+        return self._match_candidates(event, candidates)
+    
+    def _match_candidates(self, event, candidates):
+        """Return the first of `candidates` that matches `event` and whose guard (if any) evaluates to True, None otherwise (private).
+        
+        :param candidates: The non-empty tuple of candidate transitions for the class of `event`, as returned by `_find_candidates`.
+        """
+        match = _event_class_redefines_match(type(event)) and event.match
+        for transition in candidates:
+            if _TRACE:
+                _trace('trying %s', transition)
+            if not match or match(transition):
+                # the guard, if any, is known to be callable (see `Transition.__init__`)
+                guard = transition.guard
+                if guard is None or guard(event):
+                    return transition
         return None
     
     def __str__(self):
@@ -208,9 +310,14 @@ class State(object):
         By default, a state is its own 'original' state, but states created by the ``@state`` decorator 
         have a different 'original' state (see module `decorator`).
         """
-        if not other:
-            return False
-        return id(self.original) == id(other.original)
+        return isinstance(other, State) and self.original is other.original
+    
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    
+    def __hash__(self):
+        """Hash value for states, consistent with `__eq__` so that states can be used as dictionary keys."""
+        return id(self.original)
 
 
 class Transition(object):
@@ -220,18 +327,23 @@ class Transition(object):
     Transitions are created either with the `StateMachine.add_transition` or method using the ``@transition`` decorator from module `decorator`.
     
     The instance variables listed below can all be freely read by the application.
-    Except for `state`, they can also be freely written by the application.
+    Except for `state`, they can also be written by the application until the state machine is frozen:
+    once `StateMachine.freeze` has cached the description of the transition and what firing it calls, they must not be changed.
+    Transitions use ``__slots__``: the application cannot add its own attributes to them.
     
     :IVariables:
-        - `event_type`: the type of event matched by this transition.
+        - `event_type`: the type of event matched by this transition (must not be changed once the transition belongs to a state).
         - `args`: a tuple of extra arguments specifying the events matched by this transition.
         - `kwargs`: a dictionary of extra keyword arguments specifying the events matched by this transition.
-        - `guard`: the guard for this transition (``None`` if there is no guard).
+        - `guard`: the guard for this transition (``None`` if there is no guard, otherwise it must be callable).
         - `state`: the source state of this transition (must not be changed).
         - `to_state`: the destination state of this transition (if ``None``, the destination state is the same as the source state, and the enter/leave actions are *not* called).
-        - `action`: the action for this transition (``None`` if there is no action).
+        - `action`: the action for this transition (``None`` if there is no action, otherwise it must be callable).
 
     """
+    
+    __slots__ = ('event_type', 'args', 'kwargs', 'state', 'action', 'guard', 'to_state', '_fire', '_str')
+    
     def __init__(self, event_type, *args, **kwargs):
         """Initialize a transition.
         
@@ -255,30 +367,48 @@ class Transition(object):
         self.args = args
         self.kwargs = kwargs
         self.state = None
+        self._fire = None   # set by `_prepare` when the state machine is frozen
+        self._str = None    # idem
         
         # extract action, guard and destination state and remove them from kwargs
-        self.action = kwargs.get('action')
-        self.guard = kwargs.get('guard')
-        self.to_state = kwargs.get('to')
-        for attr in ('action', 'guard', 'to'):
-            try:
-                del kwargs[attr]
-            except Exception:
-                pass
+        self.action = kwargs.pop('action', None)
+        self.guard = kwargs.pop('guard', None)
+        self.to_state = kwargs.pop('to', None)
         
         # sanity checks
         if self.to_state:
             if not isinstance(self.to_state, State):
-                raise StateUnknown, "The destination state does not exist or is not a state."
-        if self.action:
+                raise StateUnknown("The destination state does not exist or is not a state.")
+        if self.action is not None:
             if not callable(self.action):
-                raise TransitionBadAction, "The transition's action is not callable."
-        if self.guard:
+                raise TransitionBadAction("The transition's action is not callable.")
+        if self.guard is not None:
             if not callable(self.guard):
-                raise TransitionBadGuard, "The transition's guard is not callable."
+                raise TransitionBadGuard("The transition's guard is not callable.")
+    
+    def _prepare(self):
+        """Precompute what firing this transition calls, once its state machine is frozen (private).
+        
+        The result is stored as a ``(leave action, transition action, destination state, enter action)`` tuple,
+        whose elements are ``None`` when there is nothing to call or no state change, so that `StateMachine.process_event`
+        can fire the transition with a single attribute lookup.
+        Since the transition does not change anymore, its description is also computed once for `__str__`.
+        """
+        to_state = self.to_state
+        if to_state is not None:
+            self._fire = (self.state._leave_cb, self.action, to_state, to_state._enter_cb)
+        else:
+            self._fire = (None, self.action, None, None)
+        self._str = str(self)
     
     def __str__(self):
-        res = 'transition on ' + self.event_type.__name__
+        if self._str is not None:
+            return self._str
+        event_type = self.event_type
+        if isinstance(event_type, tuple):
+            res = 'transition on ' + ' or '.join([t.__name__ for t in event_type])
+        else:
+            res = 'transition on ' + event_type.__name__
         if len(self.args) > 0:
             res += ' with ' + ', '.join(self.args)
         if self.guard:
@@ -304,8 +434,8 @@ class StateMachine(object):
         - `call_actions_on_suspend`: if ``True``, suspending the state machine calls the current state's leave action.
         - `call_actions_on_resume`: if ``True``, resuming the state machine calls the current state's enter action.
     
-    :group Editing: add_state, add_transition
-    :group Event processing: process_event, resume, suspend, reset
+    :group Editing: add_state, add_transition, freeze
+    :group Event processing: process_event, process_events, post_event, process_posted_events, resume, suspend, reset
     :group Iterators: all_states, all_transitions, transitions_from, transitions_to, transitions_between, transitions
     """
     
@@ -324,74 +454,101 @@ class StateMachine(object):
         super(StateMachine, self).__init__()
         
         self._sm_states = []
+        self._sm_states_by_name = {}        # the states of this machine by name
+        self._sm_states_by_original = {}    # the states of this machine by id of their 'original' state (see `State.__eq__`)
+        self._sm_all_transitions = []       # the transitions of this machine, in the order they were added
+        self._sm_transitions_to = None      # the transitions to each state, computed by `freeze`
+        self._sm_transitions_between = None # the transitions between each pair of states, computed by `freeze`
+        self._sm_listings = {}              # the tuples returned by `all_states`, `all_transitions` and `transitions_from`
         self._sm_current_state = None
         self._sm_start_state = None
+        self._sm_frozen = False
+        self._sm_posted_events = deque()    # the events queued by `post_event`
         
         self._sm_active = active;
-        self._sm_call_actions_from_reset = call_actions
-        self._sm_call_actions_from_suspend = call_actions
-        self._sm_call_actions_from_resume = call_actions
+        self._sm_call_actions_on_reset = call_actions
+        self._sm_call_actions_on_suspend = call_actions
+        self._sm_call_actions_on_resume = call_actions
     
-    # ---- iterators to list the states of this state machine and the transitions of a state
+    # ---- tuples listing the states of this state machine and the transitions of a state
+    # (once the state machine is frozen, these are the tuples it holds, otherwise tuples that are kept in `_sm_listings`
+    # until a state or transition is added, so that callers cannot modify the state machine through them)
     
     def all_states(self):
-        """Return an iterator over the states of this state machine."""
-        return iter(self._sm_states)
+        """Return a tuple of the states of this state machine."""
+        if self._sm_frozen:
+            return self._sm_states
+        listing = self._sm_listings.get('states')
+        if listing is None:
+            listing = self._sm_listings['states'] = tuple(self._sm_states)
+        return listing
     
     def all_transitions(self):
-        """Return an iterator over all the transitions of this state machine."""
-        for state in self.all_states():
-            for transition in state.transitions:
-                yield transition
+        """Return a tuple of all the transitions of this state machine, in the order in which they were added."""
+        if self._sm_frozen:
+            return self._sm_all_transitions
+        listing = self._sm_listings.get('transitions')
+        if listing is None:
+            listing = self._sm_listings['transitions'] = tuple(self._sm_all_transitions)
+        return listing
     
     def transitions_from(self, src_state):
-        """Return an iterator over the transitions from ``src_state``.
+        """Return a tuple of the transitions from ``src_state``.
         
         :param src_state: The source state (a string or a state object).
-        :except StateNotFound: The source state was not found in this state machine.
+        :except StateUnknown: The source state was not found in this state machine.
         """
-        src_state = self.find_state(src_state)
-        if not src_state:
-            raise StateNotFound
-        return iter(src_state.transitions)
+        state = self.find_state(src_state)
+        if not state:
+            raise StateUnknown("Source state unknown: %s" % src_state)
+        src_state = state
+        if self._sm_frozen:
+            return src_state.transitions
+        listing = self._sm_listings.get(src_state)
+        if listing is None:
+            listing = self._sm_listings[src_state] = tuple(src_state.transitions)
+        return listing
     
     def transitions_to(self, dest_state):
-        """Return an iterator over the transitions to ``dest_state``.
+        """Return a tuple of the transitions to ``dest_state``.
         
         :param dest_state: The destination state (a string or a state object).
-        :except StateNotFound: The destination state was not found in this state machine.
+        :except StateUnknown: The destination state was not found in this state machine.
         """ 
-        dest_state = self.find_state(dest_state)
-        if not dest_state:
-            raise StateNotFound
-        for src_state in self.all_states():
-            for transition in src_state.transitions:
-                if transition.to_state == dest_state or (not transition.to_state and src_state == dest_state):
-                    yield transition
+        state = self.find_state(dest_state)
+        if not state:
+            raise StateUnknown("Destination state unknown: %s" % dest_state)
+        dest_state = state
+        if self._sm_frozen:
+            return self._sm_transitions_to.get(dest_state, ())
+        return tuple([transition for src_state in self._sm_states for transition in src_state.transitions
+                          if (transition.to_state or src_state) is dest_state])
 
     def transitions_between(self, src_state, dest_state):
-        """Return an iterator over the transitions from ``src_state`` to ``dest_state``.
+        """Return a tuple of the transitions from ``src_state`` to ``dest_state``.
         
         :param src_state: The source state (a string or a state object).
         :param dest_state: The destination state (a string or a state object).
-        :except StateNotFound: The source or destination state was not found in this state machine.
+        :except StateUnknown: The source or destination state was not found in this state machine.
         """
-        src_state = self.find_state(src_state)
-        if not src_state:
-            raise StateNotFound
+        state = self.find_state(src_state)
+        if not state:
+            raise StateUnknown("Source state unknown: %s" % src_state)
+        src_state = state
         
-        dest_state = self.find_state(dest_state)
-        if not dest_state:
-            raise StateNotFound
+        state = self.find_state(dest_state)
+        if not state:
+            raise StateUnknown("Destination state unknown: %s" % dest_state)
+        dest_state = state
         
-        for transition in src_state.transitions:
-            if transition.to_state == dest_state or (not transition.to_state and src_state == dest_state):
-                yield transition
+        if self._sm_frozen:
+            return self._sm_transitions_between.get((src_state, dest_state), ())
+        return tuple([transition for transition in src_state.transitions if (transition.to_state or src_state) is dest_state])
     
     def transitions(self, src=None, dest=None):
-        """Return an iterator over the transitions of the state machine.
+        """Return a tuple of the transitions of the state machine.
         
-        This iterator triggers one of the other transition iterators according to the values of `src` and `dest`:
+        This method calls one of the other transition methods according to the values of `src` and `dest`:
         
             - If `src` and `dest` are ``None`` or not specified, list all transitions;
             - If `dest` is ``None`` or not specified, list transitions that leave `src`;
@@ -400,15 +557,15 @@ class StateMachine(object):
         
         :param src: The source state (a string or a state object).
         :param dest: The destination state (a string or a state object).
-        :except StateNotFound: The source or destination state was not found in this state machine.
+        :except StateUnknown: The source or destination state was not found in this state machine.
         """
         if src and dest:
             return self.transitions_between(src, dest)
         if src:
-            return self.transitions_from(dest)
+            return self.transitions_from(src)
         if dest:
-            return self.transitions_to(src)
-        return self._sm_all_transitions
+            return self.transitions_to(dest)
+        return self.all_transitions()
     
     
     # ---- find a state by name
@@ -420,14 +577,12 @@ class StateMachine(object):
         :return: The state if it was found, ``None`` otherwise.
         """
         if isinstance(name_or_string, State):
-            for s in self.all_states():
-                if s == name_or_string:
-                    return s
-        else:
-            for s in self.all_states():
-                if s.name == name_or_string:
-                    return s
-        return None
+            return self._sm_states_by_original.get(id(name_or_string.original))
+        try:
+            return self._sm_states_by_name.get(name_or_string)
+        except TypeError:
+            # unhashable, hence not a state name
+            return None
     
     def current_state(self):
         return self._sm_current_state
@@ -442,11 +597,15 @@ class StateMachine(object):
         :keyword enter: The enter action, if any (must be callable).
         :keyword leave: The leave action, if any (must be callable).
         :except StateAlreadyExists: A state with the same name already exists.
+        :except StateMachineFrozen: The state machine was frozen.
         :return: The newly created state.
         """
+        if self._sm_frozen:
+            raise StateMachineFrozen("Cannot add a state to a frozen state machine")
+        
         # check that no state has this name already
         if self.find_state(name):
-            raise StateAlreadyExists, "This state is already defined"
+            raise StateAlreadyExists("This state is already defined: %s" % name)
         
         # create a State object
         state = State(name, enter=enter, leave=leave)
@@ -458,11 +617,23 @@ class StateMachine(object):
             self._sm_current_state = state
         
         # add to self.states
-        self._sm_states.append(state)
+        self._append_state(state)
         
         # return the new state
         return state
     
+    def _append_state(self, state):
+        """Add an existing state to this state machine (private).
+        
+        :param state: The state, whose name must not be used by another state of this machine.
+        
+        The state is also indexed by name and by 'original' state, for use by `find_state`.
+        """
+        self._sm_states.append(state)
+        self._sm_states_by_name[state.name] = state
+        self._sm_states_by_original[id(state.original)] = state
+        self._sm_listings.clear()
+    
     def add_transition(self, state, event_type, *args, **kwargs):
         """Create a new transition and add it to this state machine.
         
@@ -481,25 +652,83 @@ class StateMachine(object):
             - `StateUnknown`: The destination state does not exist or is not a state.
             - `TransitionBadAction`: The transition's action is not callable.
             - `TransitionBadGuard`: The transition's guard is not callable.
+            - `StateMachineFrozen`: The state machine was frozen.
         
         :return: The newly created transition.
         """
+        if self._sm_frozen:
+            raise StateMachineFrozen("Cannot add a transition to a frozen state machine")
+        
         # check that the from state exists
         from_state = self.find_state(state)
         if not from_state:
-            raise StateUnknown, "Source state unknown:"+str(from_state)
+            raise StateUnknown("Source state unknown: %s" % state)
         
         # check that the to state exists if it is specified
-        to_state = kwargs.get('to')
-        if to_state:
-            to_state = self.find_state(to_state)
+        to = kwargs.get('to')
+        if to:
+            to_state = self.find_state(to)
             if not to_state:
-                raise StateUnknown, "Destination state unknown"+str(to_state)
+                raise StateUnknown("Destination state unknown: %s" % to)
             kwargs['to'] = to_state
         
         # add the transition to the from state
         return from_state._add_transition(event_type, *args, **kwargs)
     
+    def freeze(self):
+        """Declare that the states and transitions of this state machine are complete.
+        
+        The lists of states and transitions are turned into tuples, which are smaller and faster to iterate,
+        the actions called when firing each transition are looked up once and for all,
+        the transitions are indexed by destination state for `transitions_to` and `transitions_between`,
+        and the candidate transitions of each state are resolved for all the event classes of the transitions
+        and their subclasses, so that processing these events never walks the class hierarchy.
+        Once a state machine is frozen, `add_state` and `add_transition` raise `StateMachineFrozen`,
+        and its transitions (including their guards, arguments, actions and destination states)
+        and the enter and leave actions of its states must not be changed.
+        Freezing a state machine that is already frozen has no effect.
+        """
+        if self._sm_frozen:
+            return
+        self._sm_frozen = True
+        
+        self._sm_states = tuple(self._sm_states)
+        self._sm_all_transitions = tuple(self._sm_all_transitions)
+        self._sm_listings.clear()
+        for state in self._sm_states:
+            state.transitions = tuple(state.transitions)
+            for transition in state.transitions:
+                transition._prepare()
+        
+        transitions_to = {}
+        transitions_between = {}
+        for state in self._sm_states:
+            for transition in state.transitions:
+                dest_state = transition.to_state or state
+                transitions_to.setdefault(dest_state, []).append(transition)
+                transitions_between.setdefault((state, dest_state), []).append(transition)
+        self._sm_transitions_to = dict((key, tuple(transitions)) for key, transitions in transitions_to.items())
+        self._sm_transitions_between = dict((key, tuple(transitions)) for key, transitions in transitions_between.items())
+        
+        event_classes = set()
+        pending = [transition.event_type for transition in self._sm_all_transitions]
+        while pending:
+            event_class = pending.pop()
+            if isinstance(event_class, tuple):
+                # a transition on a tuple of types matches each of them
+                pending.extend(event_class)
+            elif event_class not in event_classes:
+                event_classes.add(event_class)
+                # a transition on ``object`` matches every class: leave those to the lazy lookup in `process_event`.
+                # `type.__subclasses__` also works for metaclasses such as `type`, whose own method is unbound
+                if event_class is not object and isinstance(event_class, type):
+                    pending.extend(type.__subclasses__(event_class))
+        for state in self._sm_states:
+            candidates = state._candidates
+            for event_class in event_classes:
+                if event_class not in candidates:
+                    candidates[event_class] = state._find_candidates(event_class)
+    
     # ---- event processing
     
     def reset(self):
@@ -509,16 +738,21 @@ class StateMachine(object):
         then the current state's leave action and the initial state's enter action, if any, are called.
         During these calls, the `active` variable is set to ``False`` so that the actions can distinguish these calls from a 'normal' call.
         """
-        if self._sm_call_actions_on_reset and self._sm_active \
-           and self._sm_current_state != self._sm_start_state:
+        state = self._sm_current_state
+        start_state = self._sm_start_state
+        if self._sm_call_actions_on_reset and self._sm_active and state is not start_state:
             # setting active to False during the reset allows the enter/leave functions to know they are being called from reset (or suspend/resume)
+            # (the actions are called through `_leave_cb` and `_enter_cb` since states declared with the ``@state``
+            # decorator redefine `enter` and `leave`)
             self._sm_active = False
-            self._sm_current_state.leave()
-            self._sm_current_state = self._sm_start_state
-            self._sm_current_state.enter()
+            if state._leave_cb:
+                state._leave_cb()
+            self._sm_current_state = start_state
+            if start_state._enter_cb:
+                start_state._enter_cb()
             self._sm_active = True
         else:
-            self._sm_current_state = self._sm_start_state
+            self._sm_current_state = start_state
     
     def suspend(self):
         """Stop processing events.
@@ -527,11 +761,13 @@ class StateMachine(object):
         then the current state's leave action, if any, is called.
         During that call, the `active` variable is set to ``False`` so that the action can distinguish this call from a 'normal' call.
         """
-        if self._sm_call_actions_on_suspend and not self._sm_active:
-            self._sm_active = False
-            # setting active to false allows the leave function to distinguish between a regular call and a call from suspend or reset
-            self._sm_current_state.leave()
+        active = self._sm_active
+        # setting active to false before the call allows the leave function to distinguish between a regular call and a call from suspend or reset
         self._sm_active = False
+        if self._sm_call_actions_on_suspend and active:
+            state = self._sm_current_state
+            if state._leave_cb:
+                state._leave_cb()
     
     def resume(self):
         """Start processing events.
@@ -541,7 +777,9 @@ class StateMachine(object):
         During that call, the `active` variable is set to ``False`` so that the action can distinguish this call from a 'normal' call.
         """
         if self._sm_call_actions_on_resume and not self._sm_active:
-            self._sm_current_state.enter()
+            state = self._sm_current_state
+            if state._enter_cb:
+                state._enter_cb()
             # setting active to true after the call allows the enter function to distinguish between a regular call and a call from resume or reset
         self._sm_active = True
     
@@ -555,34 +793,116 @@ class StateMachine(object):
         if not self._sm_active:
             return None
         
-        if __DEBUG__:
-            print
-            print 'Processing ', event
+        if _TRACE:
+            _trace('Processing %s', event)
+        
+        state = self._sm_current_state
         
-        # call the current state's 'action' function to retrieve the transition associated with this event
-        # This 'action' function is actually the 'wrapper' function of the transition class.
-        transition = self._sm_current_state.get_transition(event)
+        # same as `State.get_transition`, but with a single lookup of the candidate transitions,
+        # and a fast path for the common case of events that do not match any transition of the current state
+        event_class = type(event)
+        candidates = state._candidates.get(event_class)
+        if candidates is None:
+            candidates = state._candidates[event_class] = state._find_candidates(event_class)
+        if not candidates:
+            if _TRACE:
+                _trace('No transition for this event: ignored')
+            return False
+        
+        # retrieve the transition of the current state associated with this event
+        transition = state._match_candidates(event, candidates)
         
         # no transition: ignore event
         if not transition:
-            if __DEBUG__:
-                print 'No transition for this event: ignored'
+            if _TRACE:
+                _trace('No transition for this event: ignored')
             return False
         
         # fire the transition: call the current state's leave action, the transition's action, and the destination state's enter action
-        if transition.to_state:
-            if self._sm_current_state.leave:
-                self._sm_current_state.leave()
-            if callable(transition.action):
-                transition.action(event)
-            self._sm_current_state = transition.to_state
-            if self._sm_current_state.enter:
-                self._sm_current_state.enter()
+        # (actions were checked to be callable when they were declared)
+        fire = transition._fire
+        if fire is not None:
+            # the state machine is frozen: the actions to call were looked up by freeze
+            leave, action, to_state, enter = fire
+            if leave is not None:
+                leave()
+            if action is not None:
+                action(event)
+            if to_state is not None:
+                self._sm_current_state = to_state
+            if enter is not None:
+                enter()
+            if _TRACE:
+                _trace('-> %s', self._sm_current_state)
+            return True
+        
+        to_state = transition.to_state
+        if to_state is not None:
+            leave = state._leave_cb
+            if leave is not None:
+                leave()
+            action = transition.action
+            if action is not None:
+                action(event)
+            self._sm_current_state = to_state
+            enter = to_state._enter_cb
+            if enter is not None:
+                enter()
         else:
             # if the destination state is not specified, simply call the transition's action
-            if callable(transition.action):
-                transition.action(event)
+            action = transition.action
+            if action is not None:
+                action(event)
         
-        if __DEBUG__:
-            print '-> ', self._sm_current_state
+        if _TRACE:
+            _trace('-> %s', self._sm_current_state)
         return True
+    
+    def process_events(self, events):
+        """Process a sequence of events, in order.
+        
+        :param events: An iterable of events to process.
+        :return: The number of events that triggered a transition.
+        
+        This is equivalent to calling `process_event` for each event, but events that are known not to match
+        any transition of the current state, such as a stream of moves in a state that ignores them, are skipped
+        without a call.
+        """
+        process_event = self.process_event
+        fired = 0
+        for event in events:
+            if self._sm_active and not _TRACE:
+                candidates = self._sm_current_state._candidates.get(type(event))
+                if candidates is not None and not candidates:
+                    continue
+            if process_event(event):
+                fired += 1
+        return fired
+    
+    def post_event(self, event):
+        """Queue an event, to be processed later by `process_posted_events`.
+        
+        :param event: The event to queue.
+        
+        This method can be called from any thread, and from the actions of the state machine itself,
+        while `process_posted_events` must always be called from the same thread, e.g. by the application's event loop.
+        No lock is needed since queuing and dequeuing events are atomic operations of ``collections.deque``.
+        Events are processed in the order in which they were posted.
+        """
+        self._sm_posted_events.append(event)
+    
+    def process_posted_events(self):
+        """Process the events queued by `post_event`, including those posted while processing them.
+        
+        :return: The number of events that were processed.
+        """
+        posted_events = self._sm_posted_events
+        process_event = self.process_event
+        count = 0
+        while True:
+            try:
+                event = posted_events.popleft()
+            except IndexError:
+                return count
+            process_event(event)
+            count += 1
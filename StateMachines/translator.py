@@ -20,109 +20,210 @@
 # and GNU Lesser General Public License along with this program.  
 # If not, see <http://www.gnu.org/licenses/>.
 
-from __future__ import with_statement
+from __future__ import print_function, with_statement
 
+import importlib
+import marshal
 import os
 from os import stat
 import py_compile
 import re
+import struct
 import sys
 
-_indent_exp_str = ur'^(\s*)'
-_indent_exp = re.compile(_indent_exp_str)
-_state_exp_str = ur'^\s*State\s+(?P<name>[-A-Za-z0-9_]+)\s*(?:\(\s*(?P<parent>[-A-Za-z0-9_]+)\s*\))?\s*:'
-_state_exp = re.compile(_state_exp_str)
-_transition_exp_str = ur'^\s*Transition\s+(?P<name>[-A-Za-z0-9_]+)\s*' \
-                       ur'\(\s*self\s*,\s*(?P<args>.*)\)\s*(?:>>\s*(?P<target>.*?)\s*)?:'
-_transition_exp = re.compile(_transition_exp_str)
-_def_exp_str = ur'^\s*def\s+(?P<name>[-A-Za-z0-9_]+)\s*\(\s*self\s*(?P<args>.*)\)\s*:'
-_def_exp = re.compile(_def_exp_str)
+try:
+    # the RE2 engine matches in linear time and is preferred if installed: the translator only needs features it supports
+    import re2 as _re_engine
+except ImportError:
+    _re_engine = re
+
+try:
+    from importlib.util import MAGIC_NUMBER as _pyc_magic
+except ImportError:
+    from imp import get_magic
+    _pyc_magic = get_magic()
+
+# a single expression recognizes the three kinds of statements that are translated, in one match per line.
+# it is matched against lines stripped of their indentation; the group that holds the name tells the kind of statement.
+_state_exp_str = r'State\s+(?P<state_name>[-A-Za-z0-9_]+)\s*(?:\(\s*(?P<state_parent>[-A-Za-z0-9_]+)\s*\))?\s*:'
+_transition_exp_str = r'Transition\s+(?P<transition_name>[-A-Za-z0-9_]+)\s*' \
+                      r'\(\s*self\s*,\s*(?P<transition_args>.*)\)\s*(?:>>\s*(?P<transition_target>.*?)\s*)?:'
+_def_exp_str = r'def\s+(?P<def_name>[-A-Za-z0-9_]+)\s*\(\s*self\s*(?P<def_args>.*)\)\s*:'
+_statement_exp = _re_engine.compile(r'(?:%s|%s|%s)' % (_state_exp_str, _transition_exp_str, _def_exp_str))
+
+class _Indents(dict):
+    """A table of indentation strings: ``_indents[n]`` is a string of `n` spaces, created on first use."""
+    def __missing__(self, n):
+        indent = self[n] = ' ' * n
+        return indent
+
+_indents = _Indents()
+
+def _write_pyc(code, pycFileName, mtime, size):
+    """Write a code object to a compiled file, with the header expected by this version of Python.
+    
+    This is what ``py_compile`` does, without reading and parsing a source file.
+    `mtime` and `size` describe the source file, and must come from the same ``stat`` result.
+    """
+    header = [_pyc_magic]
+    if sys.version_info >= (3, 7):
+        header.append(struct.pack('<I', 0))     # flags: the file is checked by modification time
+    header.append(struct.pack('<I', int(mtime) & 0xFFFFFFFF))
+    if sys.version_info >= (3, 3):
+        header.append(struct.pack('<I', size & 0xFFFFFFFF))
+    with open(pycFileName, 'wb') as f:
+        f.write(b''.join(header))
+        marshal.dump(code, f)
+
+def _set_file_times(fileName, st):
+    """Set the access and modification times of a file to those of the stat result `st`, or slightly later."""
+    if sys.version_info >= (3, 3):
+        os.utime(fileName, ns=(st.st_atime_ns, st.st_mtime_ns))
+    else:
+        # times are truncated to the microsecond: round the modification time up so the file is not older than `st`
+        os.utime(fileName, (st.st_atime, st.st_mtime + 1e-6))
+
+# (modification time of the .pysm file, up-to-date target file, modification time of the target) when each .pysm file
+# was last found up to date or translated, by (.pysm, .py) absolute paths
+_stat_cache = {}
+
+def _cache_target(key, sm_mtime, fileName):
+    """Record that `fileName` is up to date with a .pysm file whose modification time is `sm_mtime` (private)."""
+    try:
+        _stat_cache[key] = (sm_mtime, fileName, stat(fileName).st_mtime)
+    except OSError:
+        _stat_cache.pop(key, None)
+
 class PySMTranslator(object):
     def translate(self, smFileName, pyFileName, cleanUp=True, force=False):
-        pycFileName = pyFileName + 'c'
-        pyoFileName = pyFileName + 'o'
-        if os.path.exists(smFileName) and (force or not (
-            (os.path.exists(pyFileName) and stat(pyFileName).st_mtime >= stat(smFileName).st_mtime)
-            or (os.path.exists(pycFileName) and stat(pycFileName).st_mtime >= stat(smFileName).st_mtime)
-            or (os.path.exists(pyoFileName) and stat(pyoFileName).st_mtime >= stat(smFileName).st_mtime))):
-            # print "Translating", inFilename, "to", outFilename
+        key = (os.path.abspath(smFileName), os.path.abspath(pyFileName))
+        try:
+            sm_stat = stat(smFileName)
+        except OSError:
+            _stat_cache.pop(key, None)
+            return
+        sm_mtime = sm_stat.st_mtime
+        
+        if not force:
+            # neither the source nor the target have changed since they were last checked
+            cached = _stat_cache.get(key)
+            if cached is not None and cached[0] == sm_mtime:
+                try:
+                    if stat(cached[1]).st_mtime == cached[2]:
+                        return
+                except OSError:
+                    # the target was removed
+                    pass
+            # stat each target once, and stop at the first one that is up to date
+            for fileName in (pyFileName, pyFileName + 'c', pyFileName + 'o'):
+                try:
+                    target_mtime = stat(fileName).st_mtime
+                except OSError:
+                    continue
+                if target_mtime >= sm_mtime:
+                    _stat_cache[key] = (sm_mtime, fileName, target_mtime)
+                    return
+        
+        # print "Translating", inFilename, "to", outFilename
+        if cleanUp:
+            # the .py file would be removed right away: compile the translation without writing it
+            source = self._doTranslate(smFileName, None)
+            self.postProcess(smFileName, pyFileName, cleanUp=cleanUp, source=source, smStat=sm_stat)
+            target = pyFileName + (__debug__ and 'c' or 'o')
+        else:
             self._doTranslate(smFileName, pyFileName)
             self.postProcess(smFileName, pyFileName, cleanUp=cleanUp)
+            target = pyFileName
+        _cache_target(key, sm_mtime, target)
     
-    def postProcess(self, fileName, pyFileName, cleanUp=True):
-        py_compile.compile(pyFileName, dfile=fileName)
-        if (os.path.exists(pyFileName + 'c') or os.path.exists(pyFileName + 'o')) and \
-           os.path.exists(pyFileName) and os.path.exists(fileName):
-           if cleanUp:
-               os.unlink(pyFileName)
-               print "Unlinking", pyFileName
+    def postProcess(self, fileName, pyFileName, cleanUp=True, source=None, smStat=None):
+        pycFileName = pyFileName + (__debug__ and 'c' or 'o')
+        if source is None:
+            py_compile.compile(pyFileName, cfile=pycFileName, dfile=fileName)
+            # py_compile reports errors without raising them: only remove pyFileName if it was compiled
+            remove = cleanUp and os.path.exists(pycFileName)
+        else:
+            # compile the translation in memory, as py_compile would have compiled pyFileName
+            if smStat is None:
+                smStat = stat(fileName)
+            code = compile(source, fileName, 'exec', 0, True)
+            _write_pyc(code, pycFileName, smStat.st_mtime, smStat.st_size)
+            # give the compiled file the time of its source, so that `translate` finds it up to date
+            # even if the clock or the resolution of file times would make it look older
+            _set_file_times(pycFileName, smStat)
+            remove = cleanUp
+        
+        # remove pyFileName, which may also be left over from an earlier translation
+        if remove:
+            try:
+                os.unlink(pyFileName)
+            except OSError:
+                pass
+            else:
+                print("Unlinking", pyFileName)
            
     def _doTranslate(self, inFilename, outFilename):
+        """Translate the file `inFilename` and return the translation, which is also written to `outFilename` unless it is None."""
         indent = 0
-        in_state = False
-        state_indent = 0
-        in_transition = False
-        transition_indent = 0
+        # the State and Transition statements being translated, as (indentation, finishing method) pairs:
+        # the first one, if any, is a state and the second one, if any, a transition of that state
+        scopes = []
+        statement_match = _statement_exp.match
+        indents = _indents
+        # the translation is accumulated in memory and written at once
+        parts = [self._initialize()]
+        write = parts.append
+        # read the whole file at once: .pysm files are small
         with open(inFilename, 'r') as f:
-            with open(outFilename, 'w') as out:
-                out.write(self._initialize())
-                
-                for line_no, line in enumerate(f):
-                    line_indent = _indent_exp.search(line).end() # Assume match
-                    code = line.strip()
-                    if not code or code.startswith('#'):
-                        # Empty line or comment
-                        out.write(line)
-                        continue
-                        
-                    if line_indent < indent:
-                        # de-dent
-                        if in_transition and line_indent <= transition_indent:
-                            in_transition = False
-                            out.write(self._finishTranslatingTransitionStatement(u' '*transition_indent))
-                            transition_indent = 0
-                        if in_state and line_indent <= state_indent:
-                            in_state = False
-                            out.write(self._finishTranslatingStateStatement(u' '*state_indent))
-                            state_indent = 0
-                            
-                    indent = line_indent
-                        
-                    if not in_state:
-                        m = _state_exp.search(line)
-                        if m:
-                            in_state = True
-                            state_indent = indent
-                            out.write(self._translateStateStatement(m, u' '*indent))
-                        else:
-                            out.write(line)
-                    else: 
-                        # Parsing in_state
-                        m = _def_exp.search(line)
-                        if m:
-                            out.write(self._translateDefStatement(m, u' '*indent))
-                        elif not in_transition: 
-                            m = _transition_exp.search(line)
-                            if m:
-                                in_transition = True
-                                transition_indent = indent
-                                out.write(self._translateTransitionStatement(m, u' '*indent))
-                            else:
-                                out.write(line)
-                        else:
-                            # Not a def statement or a transition statement, write it as-is
-                            out.write(line)
-                
-                # Clean up
-                out.write("\n")
-                
-                if in_transition:
-                    out.write(self._finishTranslatingTransitionStatement(u' '*transition_indent))
+            lines = f.readlines()
+        
+        for line in lines:
+            code = line.lstrip()
+            line_indent = len(line) - len(code)
+            if not code or code[0] == '#':
+                # Empty line or comment
+                write(line)
+                continue
                 
-                if in_state:
-                    out.write(self._finishTranslatingStateStatement(u' '*state_indent))
-                            
-                            
+            if line_indent < indent:
+                # de-dent: finish the statements whose body ends here
+                while scopes and line_indent <= scopes[-1][0]:
+                    scope_indent, finish = scopes.pop()
+                    write(finish(indents[scope_indent]))
+                    
+            indent = line_indent
+            
+            m = statement_match(code)
+            if not scopes:
+                if m and m.group('state_name'):
+                    scopes.append((indent, self._finishTranslatingStateStatement))
+                    write(self._translateStateStatement(m, indents[indent]))
+                else:
+                    write(line)
+            else: 
+                # Parsing in_state
+                if m and m.group('def_name'):
+                    write(self._translateDefStatement(m, indents[indent]))
+                elif m and m.group('transition_name') and len(scopes) == 1:
+                    scopes.append((indent, self._finishTranslatingTransitionStatement))
+                    write(self._translateTransitionStatement(m, indents[indent]))
+                else:
+                    # Not a def statement or a transition statement, write it as-is
+                    write(line)
+        
+        # Clean up
+        write("\n")
+        
+        while scopes:
+            scope_indent, finish = scopes.pop()
+            write(finish(indents[scope_indent]))
+        
+        source = ''.join(parts)
+        if outFilename is not None:
+            with open(outFilename, 'w') as out:
+                out.write(source)
+        return source
+    
     def _initialize(self):
         return ''
 #         return '''\
@@ -133,8 +234,8 @@ class PySMTranslator(object):
 # '''
         
     def _translateStateStatement(self, m, indent):
-        name = m.group("name")
-        parent = m.group("parent")
+        name = m.group("state_name")
+        parent = m.group("state_parent")
         
         if not parent:
             parent = 'State'
@@ -142,20 +243,19 @@ class PySMTranslator(object):
         self._stateName = name
         
         # return indent + "class %sState(%s):\n" % (name, parent)
-        return indent + "@state\n" + \
-               indent + "def %s(self):\n" % (name)
+        return ''.join((indent, "@state\n", indent, "def ", name, "(self):\n"))
     
     def _finishTranslatingStateStatement(self, my_indent):
         # return "%s%s = %sState()\n\n\n" % (my_indent, self._stateName, self._stateName)
         return ""
     
     def _translateTransitionStatement(self, m, indent):
-        name = m.group("name")
-        args = m.group("args")
-        targetState = m.group("target")
+        name = m.group("transition_name")
+        args = m.group("transition_args")
+        targetState = m.group("transition_target")
         
         if targetState:
-            target = ", to=%s" % (targetState)
+            target = ", to=" + targetState
         else:
             target = ""
         
@@ -163,41 +263,84 @@ class PySMTranslator(object):
         
         # return indent + "@transition(%s%s)\n" % (args, target) + \
         #        indent + "def %s(state, self):\n" % (name)
-        return indent + "@transition(%s%s)\n" % (args, target) + \
-               indent + "def action(event):\n"
+        return ''.join((indent, "@transition(", args, target, ")\n", indent, "def action(event):\n"))
     
     def _finishTranslatingTransitionStatement(self, my_indent):
         return ''
     
     def _translateDefStatement(self, m, indent):
-        name = m.group("name")
-        args = m.group("args")
+        name = m.group("def_name")
+        args = m.group("def_args")
         
         # return indent + "def %s(state, %s):\n" % (name, args)
         # return indent + "def %s(%s):\n" % (name, args)
         decorator = ''
         if name in ('enter', 'leave'):
-            decorator = "%s@state.%s\n" % (indent, name)
-        return "%s%sdef %s(%s):\n" % (decorator, indent, name, args)
+            decorator = ''.join((indent, "@state.", name, "\n"))
+        return ''.join((decorator, indent, "def ", name, "(", args, "):\n"))
+
+# the names of the modules that have a .pysm file in each directory, with the modification time of the directory
+_dir_cache = {}
+
+def _pysm_modules(d):
+    """Return the set of module names that have a .pysm file in directory `d`.
+    
+    The directory is only listed again when its modification time changes, i.e. when files are added or removed.
+    """
+    try:
+        mtime = stat(d or os.curdir).st_mtime
+    except OSError:
+        # the path entry does not exist
+        return frozenset()
+    cached = _dir_cache.get(d)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        names = frozenset([name[:-5] for name in os.listdir(d or os.curdir) if name.endswith('.pysm')])
+    except OSError:
+        # not a directory, e.g. a zip file
+        names = frozenset()
+    _dir_cache[d] = (mtime, names)
+    return names
 
 class PySMMetaImporter(object):
     def find_module(self, fullname, path=None):
         # print 'find_module(%s, %s)' % (fullname, path)
+        self._translate(fullname, path)
+        return None
+    
+    def find_spec(self, fullname, path=None, target=None):
+        """Translate the ``.pysm`` file of a module, if any, and let the regular finders import the result (Python 3)."""
+        if self._translate(fullname, path):
+            # the path finders may have cached the directory before the compiled file was written
+            importlib.invalidate_caches()
+        return None
+    
+    def _translate(self, fullname, path):
+        """Translate the first ``.pysm`` file of module `fullname` on `path`, and return whether there is one (private)."""
         moduleName = fullname.rsplit('.', 1)[-1]
         for d in (path or sys.path):
-            fileName = os.path.join(d, moduleName + '.pysm')
-            pyFileName = os.path.join(d, moduleName + '.py')
-            if os.path.exists(fileName):
-                print 'translating', fileName, 'to', pyFileName
-                PySMTranslator().translate(fileName,
-                                           os.path.join(d, moduleName + '.py'))
-                
-        
-        return None
+            if moduleName in _pysm_modules(d):
+                fileName = os.path.join(d, moduleName + '.pysm')
+                pyFileName = os.path.join(d, moduleName + '.py')
+                print('translating', fileName, 'to', pyFileName)
+                PySMTranslator().translate(fileName, pyFileName)
+                # the module will be found in this directory first, so stop here
+                return True
+        return False
 
-sys.meta_path.append(PySMMetaImporter())
+def register():
+    """Install the importer that translates ``.pysm`` files when the corresponding module is imported.
+    
+    The importer is not installed by importing this module, since it then checks for ``.pysm`` files on every import.
+    It is installed only once, even if this function is called several times or this module is reloaded.
+    Setting the environment variable ``PYSM_AUTOIMPORT`` installs it when package `StateMachines` is imported.
+    """
+    if not any(type(finder).__name__ == 'PySMMetaImporter' for finder in sys.meta_path):
+        # with Python 3 the regular finders are also on `sys.meta_path`: translate before they look for the module
+        sys.meta_path.insert(0, PySMMetaImporter())
 
-__all__ = ['PySMTranslator']
+__all__ = ['PySMTranslator', 'register']
 
         
 if __name__ == '__main__':
@@ -213,7 +356,7 @@ if __name__ == '__main__':
         elif arg == '--noCleanUp':
             options['cleanUp'] = False
         elif arg.startswith('--'):
-            print "Unrecognized option:", arg
+            print("Unrecognized option:", arg)
         else:
             args.append(arg)
     
@@ -222,6 +365,6 @@ if __name__ == '__main__':
     else:
         outFile = args[2]
         
-    print 'translate from %s to %s' % (args[1], outFile)
+    print('translate from %s to %s' % (args[1], outFile))
     translator.translate(args[1], outFile, **options)
     
@@ -20,11 +20,12 @@
 # and GNU Lesser General Public License along with this program.  
 # If not, see <http://www.gnu.org/licenses/>.
 
-import StateMachines
+import StateMachines.translator
+StateMachines.translator.register()     # installs the importer for .pysm files
 import pysmTest
 
 import subprocess
 import sys
 
-#subprocess.call(("%s pysmTest.py" % (sys.executable)).split())
-subprocess.Popen("python pysmTest.pyc", shell=True)
+# run the compiled tests with this interpreter, which is the one that compiled them
+subprocess.Popen([sys.executable, 'pysmTest.pyc'])
@@ -23,29 +23,42 @@
 
 """ This module tests state machines."""
 
+from __future__ import print_function
+
+import abc
+import collections
 import unittest
 import StateMachines
 from StateMachines import *
 
+# set to True to trace the actions of the example state machines
+DEBUG = False
+
 # -------- utilities for the state machine examples --------
 
 class Point(object):
+    __slots__ = ('x', 'y')
+    
     def __init__(self, x, y):
         super(Point, self).__init__()
         self.x = x
         self.y = y
         
 class Key(Event):
+    __slots__ = ('key',)
+    event_name = "Key"
+    
     def __init__(self, key):
-        super(Press, self).__init__("Key")
         self.key = key
     
     def __str__(self):
         return 'Key %d' % self.key
 
 class Press(Event):
+    __slots__ = ('button', 'x', 'y')
+    event_name = "Press"
+    
     def __init__(self, button, x, y):
-        super(Press, self).__init__("Press")
         self.button = button
         self.x = x
         self.y = y
@@ -59,8 +72,10 @@ class Press(Event):
         return 'Press %s at %d, %d' % (self.button, self.x, self.y)
 
 class Move(Event):
+    __slots__ = ('x', 'y')
+    event_name = "Move"
+    
     def __init__(self, x, y):
-        super(Move, self).__init__("Move")
         self.x = x
         self.y = y
     
@@ -68,8 +83,10 @@ class Move(Event):
         return 'Move to %d, %d' % (self.x, self.y)
 
 class Release(Event):
+    __slots__ = ('button', 'x', 'y')
+    event_name = "Release"
+    
     def __init__(self, button, x, y):
-        super(Release, self).__init__("Release")
         self.button = button
         self.x = x
         self.y = y
@@ -82,11 +99,35 @@ class Release(Event):
     def __str__(self):
         return 'Release %s at %d, %d' % (self.button, self.x, self.y)
 
-        
+
+
+# a press-drag-release sequence, with the name of the state expected after processing each event
+DRAG_SEQUENCE = [
+    (Press('Button1', 10, 10), 'wait'),
+    (Move(12, 10), 'wait'),
+    (Move(14, 14), 'wait'),
+    (Move(16, 14), 'drag'),
+    (Move(20, 16), 'drag'),
+    (Release('Button2', 16, 16), 'drag'),
+    (Release('Button1', 16, 16), 'start'),
+]
+
+def checkDragSequence(test, sm):
+    """process DRAG_SEQUENCE with the state machine `sm`, checking its current state after each event"""
+    for event, expected in DRAG_SEQUENCE:
+        sm.process_event(event)
+        test.assertIs(sm._sm_current_state, sm.find_state(expected))
+
+def checkListings(test, sm):
+    """check that the methods listing the states and transitions of `sm` return tuples, whether it is frozen or not"""
+    start = sm.find_state('start')
+    for listing in (sm.all_states(), sm.all_transitions(), sm.transitions_from(start),
+                    sm.transitions_to(start), sm.transitions_between(start, start), sm.transitions()):
+        test.assertTrue(isinstance(listing, tuple))
 
 # -------- An example --------
 
-print 'Declaring DragSM'
+print('Declaring DragSM')
 
 class DragSM(statemachine):
     """A state machine for drag-and-drop"""
@@ -96,12 +137,10 @@ class DragSM(statemachine):
     
     startPoint = Point(0,0)
     
-    def hysteresis(self, p1, p2, delta=5):
-        if abs(p1.x - p2.x) > delta:
-            return True
-        if abs(p1.y - p2.y) > delta:
-            return True
-        return False
+    def hysteresis(self, event, delta=5):
+        # guard of the wait state: has the mouse moved far enough from the start point?
+        p = self.startPoint
+        return abs(p.x - event.x) > delta or abs(p.y - event.y) > delta
     
     @state
     def start(self):
@@ -109,11 +148,13 @@ class DragSM(statemachine):
         
         @state.enter
         def enter():
-            print "entering Start"
+            if DEBUG:
+                print("entering Start")
         
         @state.leave
         def leave():
-            print "leaving Start"
+            if DEBUG:
+                print("leaving Start")
         
         @transition(Press, 'Button1', to=self.wait)
         def action(event):
@@ -121,11 +162,12 @@ class DragSM(statemachine):
         
         @transition(Key, to=self.drag)
         def action(event):
-            print "transition Key"
+            if DEBUG:
+                print("transition Key")
     
     @state
     def wait(self):
-        @transition(Move, guard=lambda event: self.hysteresis(self.startPoint, event), to=self.drag)
+        @transition(Move, guard=self.hysteresis, to=self.drag)
         def action(event):
             pass
     
@@ -135,32 +177,36 @@ class DragSM(statemachine):
         
         @state.enter
         def enter():
-            print "entering Drag"
+            if DEBUG:
+                print("entering Drag")
         
         @state.leave
         def leave():
-            print "leaving Drag"
+            if DEBUG:
+                print("leaving Drag")
         
         @transition(Move)
         def action(event):
-            print "dragging"
+            if DEBUG:
+                print("dragging")
         
         @transition(Release, 'Button1', to=self.start)
         def action(event):
-                print "transition Release"
+                if DEBUG:
+                    print("transition Release")
 
-print 'Done declaring DragSM'
-print
+print('Done declaring DragSM')
+print()
 
 class StaticSMTest(unittest.TestCase):
 
     def testOK(self):
-        print 'testOK'
-        print 'Instantiating DragSM'
+        print('testOK')
+        print('Instantiating DragSM')
         dnd = DragSM()
-        print 'Done instantiating DragSM'
+        print('Done instantiating DragSM')
         
-        self.assertEqual([str(state) for state in dnd.all_states()], ['state start', 'state drag', 'state wait'])
+        self.assertEqual([str(state) for state in dnd.all_states()], ['state start', 'state wait', 'state drag'])
         self.assertEqual([str(trans) for trans in dnd.transitions_from(dnd.start)], 
             ['transition on Press with Button1 to state wait', 'transition on Key to state drag'])
         self.assertEqual([str(trans) for trans in dnd.transitions_from(dnd.wait)], 
@@ -169,46 +215,27 @@ class StaticSMTest(unittest.TestCase):
             ['transition on Move to itself', 'transition on Release with Button1 to state start'])
         
         self.assertEqual([str(trans) for trans in dnd.transitions_to(dnd.drag)], 
-            ['transition on Key to state drag', 'transition on Move to itself', 'transition on Move with guard to state drag'])
+            ['transition on Key to state drag', 'transition on Move with guard to state drag', 'transition on Move to itself'])
         self.assertEqual([str(trans) for trans in dnd.transitions_between(dnd.drag, dnd.start)], 
             ['transition on Release with Button1 to state start'])
         self.assertEqual([str(trans) for trans in dnd.all_transitions()], 
             ['transition on Press with Button1 to state wait', 
              'transition on Key to state drag', 
+             'transition on Move with guard to state drag', 
              'transition on Move to itself', 
-             'transition on Release with Button1 to state start', 
-             'transition on Move with guard to state drag'
+             'transition on Release with Button1 to state start'
             ])
         
         
         # test the equality test of states
         self.assertEqual(dnd.wait, dnd.find_state(dnd.wait))
         
-        dnd.process_event(Press('Button1', 10, 10))
-        self.assertEqual(dnd._sm_current_state, dnd.wait)
-        
-        dnd.process_event(Move(12, 10))
-        self.assertEqual(dnd._sm_current_state, dnd.wait)
-        
-        dnd.process_event(Move(14, 14))
-        self.assertEqual(dnd._sm_current_state, dnd.wait)
-        
-        dnd.process_event(Move(16, 14))
-        self.assertEqual(dnd._sm_current_state, dnd.drag)
-        
-        dnd.process_event(Move(20, 16))
-        self.assertEqual(dnd._sm_current_state, dnd.drag)
-        
-        dnd.process_event(Release('Button2', 16, 16))
-        self.assertEqual(dnd._sm_current_state, dnd.drag)
-        
-        dnd.process_event(Release('Button1', 16, 16))
-        self.assertEqual(dnd._sm_current_state, dnd.start)
-        print 'Done testOK'
-        print
+        checkDragSequence(self, dnd)
+        print('Done testOK')
+        print()
     
     def testBadActionName(self):
-        print 'testBadActionName'
+        print('testBadActionName')
         class BadActionName(statemachine):
             @state
             def start(self):
@@ -216,22 +243,22 @@ class StaticSMTest(unittest.TestCase):
                 def myaction(event):    # should be 'action'
                     pass
         self.assertRaises(TransitionBadActionName, BadActionName)
-        print 'Done testBadActionName'
-        print
+        print('Done testBadActionName')
+        print()
     
     def testDeclarationError(self):
-        print 'testDeclarationError'
+        print('testDeclarationError')
         class BadDeclaration(statemachine):
             #@transition(Press)
             def action(event):
                 pass
             # this is equivalent to having @transition above
             self.assertRaises(TransitionDeclarationError, transition(Press), action)
-        print 'Done testDeclarationError'
-        print
+        print('Done testDeclarationError')
+        print()
 
     def testBadToState(self):
-        print 'testBadToState'
+        print('testBadToState')
         class BadToState(statemachine):
             @state
             def start(self):
@@ -241,46 +268,148 @@ class StaticSMTest(unittest.TestCase):
             def other():
                 pass
         self.assertRaises(StateUnknown, BadToState)
-        print 'Done testBadToState'
-        print
+        print('Done testBadToState')
+        print()
+    
+    def testActions(self):
+        print('testActions')
+        class ActionsSM(statemachine):
+            def __init__(self):
+                self.log = []
+                super(ActionsSM, self).__init__()
+            
+            @state
+            def start(self):
+                @state.leave
+                def leave():
+                    self.log.append('leave start')
+                
+                @transition(Press, to=self.other)
+                def action(event):
+                    self.log.append('press')
+            
+            @state
+            def other(self):
+                @state.enter
+                def enter():
+                    self.log.append('enter other')
+                
+                @transition(Move)
+                def action(event):
+                    self.log.append('move')
+        
+        sm = ActionsSM()
+        sm.process_event(Press('Button1', 0, 0))
+        sm.process_event(Move(0, 0))
+        self.assertEqual(sm.log, ['leave start', 'press', 'enter other', 'move'])
+        print('Done testActions')
+        print()
+    
+    def testProcessEvents(self):
+        print('testProcessEvents')
+        events = [Move(0, 0), Press('Button1', 10, 10), Move(12, 10), Move(14, 14), Move(16, 14), Move(18, 14), Release('Button1', 18, 14), Move(0, 0)]
+        dnd = DragSM()
+        fired = len([event for event in events if dnd.process_event(event)])
+        dnd = DragSM()
+        self.assertEqual(dnd.process_events(events[:6]), fired - 1)
+        self.assertEqual(dnd._sm_current_state, dnd.drag)
+        self.assertEqual(dnd.process_events(iter(events[6:])), 1)
+        self.assertEqual(dnd._sm_current_state, dnd.start)
+        print('Done testProcessEvents')
+        print()
+    
+    def testPostEvent(self):
+        print('testPostEvent')
+        dnd = DragSM()
+        dnd.post_event(Press('Button1', 10, 10))
+        dnd.post_event(Move(16, 14))
+        self.assertEqual(dnd._sm_current_state, dnd.start)
+        self.assertEqual(dnd.process_posted_events(), 2)
+        self.assertEqual(dnd._sm_current_state, dnd.drag)
+        self.assertEqual(dnd.process_posted_events(), 0)
+        print('Done testPostEvent')
+        print()
+    
+    def testFreeze(self):
+        print('testFreeze')
+        dnd = DragSM()
+        transitions_to = dict((state.name, list(dnd.transitions_to(state))) for state in dnd.all_states())
+        transitions_between = dict(((src.name, dest.name), list(dnd.transitions_between(src, dest)))
+                                   for src in dnd.all_states() for dest in dnd.all_states())
+        descriptions = [str(trans) for trans in dnd.all_transitions()]
+        checkListings(self, dnd)
+        dnd.freeze()
+        dnd.freeze()
+        checkListings(self, dnd)
+        self.assertEqual([str(trans) for trans in dnd.all_transitions()], descriptions)
+        for state in dnd.all_states():
+            for event_class in (Press, Move, Release):
+                self.assertTrue(event_class in state._candidates)
+        for state in dnd.all_states():
+            self.assertEqual(list(dnd.transitions_to(state)), transitions_to[state.name])
+        for src in dnd.all_states():
+            for dest in dnd.all_states():
+                self.assertEqual(list(dnd.transitions_between(src, dest)), transitions_between[src.name, dest.name])
+        self.assertRaises(StateMachineFrozen, dnd.add_state, 'other')
+        self.assertRaises(StateMachineFrozen, dnd.add_transition, 'start', Move)
+        
+        dnd.process_event(Press('Button1', 10, 10))
+        dnd.process_event(Move(16, 14))
+        self.assertEqual(dnd._sm_current_state, dnd.drag)
+        dnd.process_event(Release('Button1', 16, 16))
+        self.assertEqual(dnd._sm_current_state, dnd.start)
+
+        # a transition on ``object`` matches any event, and freezing does not walk all the classes
+        catch_all = StateMachine()
+        catch_all.add_state('start')
+        catch_all.add_state('other')
+        catch_all.add_transition('start', object, to='other')
+        catch_all.freeze()
+        self.assertEqual(list(catch_all.find_state('start')._candidates), [object])
+        catch_all.process_event(Key('a'))
+        self.assertIs(catch_all._sm_current_state, catch_all.find_state('other'))
+        print('Done testFreeze')
+        print()
     
     def testFindState(self):
-        print 'testFindState'
-        print 'Instantiating DragSM'
+        print('testFindState')
+        print('Instantiating DragSM')
         dnd = DragSM()
-        print 'Done instantiating DragSM'
+        print('Done instantiating DragSM')
         self.assertNotEqual(dnd.find_state('drag'), None)
         self.assertNotEqual(dnd.find_state(dnd.drag), None)
         self.assertEqual(dnd.find_state('drag'), dnd.find_state(dnd.drag))
         self.assertEqual(dnd.find_state('drag'), dnd.drag)
         self.assertEqual(dnd.find_state('foo'), None)
         self.assertEqual(dnd.find_state(dnd.hysteresis), None)
-        print 'Done testFindState'
-        print
+        self.assertEqual(dnd.find_state(['drag']), None)
+        print('Done testFindState')
+        print()
     
 class DynamicSMTest(unittest.TestCase):
     def testDynSM(self):
-        print 'testDynSM'
+        print('testDynSM')
         class MySM(StateMachine):
             """a state machine where states are built dynamically"""
             startPoint = Point(0,0)
 
-            def hysteresis(self, p1, p2, delta=5):
-                if abs(p1.x - p2.x) > delta:
-                    return True
-                if abs(p1.y - p2.y) > delta:
-                    return True
-                return False
+            def hysteresis(self, event, delta=5):
+                # guard of the wait state: has the mouse moved far enough from the start point?
+                p = self.startPoint
+                return abs(p.x - event.x) > delta or abs(p.y - event.y) > delta
 
             def enter_start(self):
-                print "Entering start state"
+                if DEBUG:
+                    print("Entering start state")
 
             def leave_start(self):
-                print "Leaving start state"
+                if DEBUG:
+                    print("Leaving start state")
 
             def press_action(self, event):
                 self.startPoint = Point(event.x, event.y)
-                print "Pressed button in start state"
+                if DEBUG:
+                    print("Pressed button in start state")
         
             def __init__(self):
                 super(MySM, self).__init__()
@@ -290,13 +419,13 @@ class DynamicSMTest(unittest.TestCase):
                 
                 self.add_transition('start', Press, 'Button1', to='wait', action=self.press_action)
                 self.add_transition('start', Key, to='drag')
-                self.add_transition('wait', Move, guard=lambda event: self.hysteresis(self.startPoint, event), to='drag')
+                self.add_transition('wait', Move, guard=self.hysteresis, to='drag')
                 self.add_transition('drag', Move)
                 self.add_transition('drag', Release, 'Button1', to='start')
 
-        print "Instantiating MySM"
+        print("Instantiating MySM")
         sm = MySM()
-        print "Done instantiating MySM"
+        print("Done instantiating MySM")
         
         self.assertEqual([str(state) for state in sm.all_states()], ['state start', 'state wait', 'state drag'])
         self.assertEqual([str(trans) for trans in sm.transitions_from('start')], 
@@ -318,70 +447,245 @@ class DynamicSMTest(unittest.TestCase):
              'transition on Release with Button1 to state start'
             ])
         
-        sm.process_event(Press('Button1', 10, 10))
-        self.assertEqual(sm._sm_current_state, sm.find_state('wait'))
-        
-        sm.process_event(Move(12, 10))
-        self.assertEqual(sm._sm_current_state, sm.find_state('wait'))
+        self.assertEqual(list(sm.transitions()), list(sm.all_transitions()))
+        self.assertEqual(list(sm.transitions('drag')), list(sm.transitions_from('drag')))
+        self.assertEqual(list(sm.transitions(dest='drag')), list(sm.transitions_to('drag')))
+        self.assertEqual(list(sm.transitions('drag', 'start')), list(sm.transitions_between('drag', 'start')))
         
-        sm.process_event(Move(14, 14))
-        self.assertEqual(sm._sm_current_state, sm.find_state('wait'))
+        checkDragSequence(self, sm)
         
-        sm.process_event(Move(16, 14))
-        self.assertEqual(sm._sm_current_state, sm.find_state('drag'))
-        
-        sm.process_event(Move(20, 16))
-        self.assertEqual(sm._sm_current_state, sm.find_state('drag'))
-        
-        sm.process_event(Release('Button2', 16, 16))
-        self.assertEqual(sm._sm_current_state, sm.find_state('drag'))
+        print('Done testDynSM')
+        print()
+    
+    def testResetSuspendResume(self):
+        print('testResetSuspendResume')
+        log = []
+        sm = StateMachine(call_actions=True)
+        for name in ('start', 'other'):
+            sm.add_state(name, enter=lambda name=name: log.append('enter ' + name),
+                               leave=lambda name=name: log.append('leave ' + name))
+        sm.add_transition('start', Press, to='other')
+        self.checkResetSuspendResume(sm, log)
+        
+        class LoggingSM(statemachine):
+            def __init__(self, log):
+                self.log = log
+                super(LoggingSM, self).__init__(call_actions=True)
+            
+            @state
+            def start(self):
+                @state.enter
+                def enter():
+                    self.log.append('enter start')
+                
+                @state.leave
+                def leave():
+                    self.log.append('leave start')
+                
+                @transition(Press, to=self.other)
+                def action(event):
+                    pass
+            
+            @state
+            def other(self):
+                @state.enter
+                def enter():
+                    self.log.append('enter other')
+                
+                @state.leave
+                def leave():
+                    self.log.append('leave other')
+        
+        log = []
+        sm = LoggingSM(log)
+        self.assertEqual(log, ['enter start'])
+        del log[:]
+        self.checkResetSuspendResume(sm, log)
+        print('Done testResetSuspendResume')
+        print()
+    
+    def checkResetSuspendResume(self, sm, log):
+        """check the actions called by `sm`, whose states 'start' and 'other' log their actions to `log`"""
+        sm.process_event(Press('Button1', 0, 0))
+        self.assertEqual(log, ['leave start', 'enter other'])
+        del log[:]
+        sm.suspend()
+        sm.suspend()
+        self.assertEqual(log, ['leave other'])
+        del log[:]
+        sm.resume()
+        sm.resume()
+        self.assertEqual(log, ['enter other'])
+        del log[:]
+        sm.reset()
+        self.assertEqual(log, ['leave other', 'enter start'])
+        self.assertIs(sm._sm_current_state, sm.find_state('start'))
+        self.assertTrue(sm._sm_active)
+        del log[:]
+        sm.reset()
+        self.assertEqual(log, [])
+    
+    def testEventSubclasses(self):
+        print('testEventSubclasses')
+        sm = StateMachine()
+        sm.add_state('start')
+        sm.add_state('any')
+        sm.add_state('press')
+        sm.add_transition('start', Press, 'Button2', to='press')
+        sm.add_transition('start', Event, to='any')
+        sm.add_transition('start', Press, to='press')
+        
+        # transitions on the event's class and on its base classes are tried in declaration order
+        self.assertEqual(sm.find_state('start').get_transition(Press('Button2', 0, 0)).to_state, sm.find_state('press'))
+        self.assertEqual(sm.find_state('start').get_transition(Press('Button1', 0, 0)).to_state, sm.find_state('any'))
+        self.assertEqual(sm.find_state('start').get_transition(Move(0, 0)).to_state, sm.find_state('any'))
+        self.assertEqual(sm.find_state('any').get_transition(Move(0, 0)), None)
+        
+        # transitions added after events have been dispatched are taken into account
+        sm.add_transition('any', Move, to='start')
+        self.assertEqual(sm.find_state('any').get_transition(Move(0, 0)).to_state, sm.find_state('start'))
+        print('Done testEventSubclasses')
+        print()
+    
+    def testAbstractEventTypes(self):
+        print('testAbstractEventTypes')
+        # an abstract base class, with an event class registered as a virtual subclass
+        Pointer = abc.ABCMeta('Pointer', (object,), {})
+        Pointer.register(Move)
+        for frozen in (False, True):
+            sm = StateMachine()
+            sm.add_state('start')
+            sm.add_state('pointer')
+            sm.add_state('button')
+            sm.add_transition('start', Pointer, to='pointer')
+            sm.add_transition('start', (Press, Release), to='button')
+            if frozen:
+                sm.freeze()
+            start = sm.find_state('start')
+            self.assertIs(start.get_transition(Move(0, 0)).to_state, sm.find_state('pointer'))
+            self.assertIs(start.get_transition(Press('Button1', 0, 0)).to_state, sm.find_state('button'))
+            self.assertIs(start.get_transition(Release('Button1', 0, 0)).to_state, sm.find_state('button'))
+            self.assertEqual(start.get_transition(Key('a')), None)
+        print('Done testAbstractEventTypes')
+        print()
+    
+    def testTupleEvents(self):
+        print('testTupleEvents')
+        # `Event` has no instance layout of its own, so events can also be named tuples
+        class Click(Event, collections.namedtuple('ClickFields', 'button x y')):
+            __slots__ = ()
+            event_name = 'Click'
+            
+            def __init__(self, button, x, y):
+                # the fields are set by the named tuple
+                pass
         
-        sm.process_event(Release('Button1', 16, 16))
-        self.assertEqual(sm._sm_current_state, sm.find_state('start'))
+        sm = StateMachine()
+        sm.add_state('start')
+        sm.add_state('clicked')
+        sm.add_transition('start', Click, to='clicked')
+        click = Click('Button1', 3, 4)
+        self.assertEqual((click.button, click.x, click.y), ('Button1', 3, 4))
+        self.assertEqual(click.type, None)
+        sm.process_event(click)
+        self.assertIs(sm._sm_current_state, sm.find_state('clicked'))
+        print('Done testTupleEvents')
+        print()
+    
+    def testEventName(self):
+        print('testEventName')
+        # subclasses that name their events with `event_name` need neither an `__init__` nor a type
+        class Bare(Event):
+            __slots__ = ()
+            event_name = 'Bare'
+        
+        class Typed(Event):
+            pass
         
-        print 'Done testDynSM'
-        print
+        sm = StateMachine()
+        sm.add_state('start')
+        sm.add_state('bare')
+        sm.add_transition('start', Bare, to='bare')
+        bare = Bare()
+        self.assertEqual(bare.type, None)
+        sm.process_event(bare)
+        self.assertIs(sm._sm_current_state, sm.find_state('bare'))
+        self.assertIs(Typed(Typed).type, Typed)
+        print('Done testEventName')
+        print()
+    
+    def testUnknownState(self):
+        print('testUnknownState')
+        sm = StateMachine()
+        sm.add_state('start')
+        self.assertRaises(StateUnknown, sm.transitions_from, 'foo')
+        self.assertRaises(StateUnknown, sm.transitions_to, 'foo')
+        self.assertRaises(StateUnknown, sm.transitions_between, 'start', 'foo')
+        self.assertRaises(StateUnknown, sm.transitions_between, 'foo', 'start')
+        self.assertRaises(StateUnknown, sm.transitions, 'start', 'foo')
+        sm.freeze()
+        self.assertRaises(StateUnknown, sm.transitions_between, 'start', 'foo')
+        print('Done testUnknownState')
+        print()
+    
+    def testListings(self):
+        print('testListings')
+        sm = StateMachine()
+        sm.add_state('start')
+        sm.add_transition('start', Press, to='start')
+        states, transitions, from_start = sm.all_states(), sm.all_transitions(), sm.transitions_from('start')
+        # the listings are only computed again once the state machine changes
+        self.assertIs(sm.all_states(), states)
+        self.assertIs(sm.all_transitions(), transitions)
+        self.assertIs(sm.transitions_from('start'), from_start)
+        sm.add_state('other')
+        self.assertEqual(len(sm.all_states()), 2)
+        sm.add_transition('start', Move, to='other')
+        self.assertEqual(len(sm.all_transitions()), 2)
+        self.assertEqual(len(sm.transitions_from('start')), 2)
+        print('Done testListings')
+        print()
 
 
 class HybridSMTest(unittest.TestCase):
     
-    print "Declaring MyHybridSM"
+    print("Declaring MyHybridSM")
     class MyHybridSM(statemachine):
         startPoint = Point(0,0)
 
-        def hysteresis(self, p1, p2, delta=5):
-            if abs(p1.x - p2.x) > delta:
-                return True
-            if abs(p1.y - p2.y) > delta:
-                return True
-            return False
+        def hysteresis(self, event, delta=5):
+            # guard of the wait state: has the mouse moved far enough from the start point?
+            p = self.startPoint
+            return abs(p.x - event.x) > delta or abs(p.y - event.y) > delta
 
         @state
         def start(self):
             @transition(Press, 'Button1', to=self.wait)
             def action(event):
                 self.startPoint = Point(event.x, event.y)
-                print "Pressed"
+                if DEBUG:
+                    print("Pressed")
 
         @state
         def wait(self):
             pass
-    print "Done declaring MyHybridSM"
-    print
+    print("Done declaring MyHybridSM")
+    print()
     
     def testHybridSM(self):
-        print 'testHybridSM'
+        print('testHybridSM')
             
         def indrag():
-            print "in drag"
+            if DEBUG:
+                print("in drag")
         
-        print "Instantiating MyHybridSM"
+        print("Instantiating MyHybridSM")
         sm = HybridSMTest.MyHybridSM()
-        print "Done instantiating MyHybridSM"
+        print("Done instantiating MyHybridSM")
         
         sm.add_state('drag', enter=indrag)
         sm.add_transition('start', Key, to='drag')
-        sm.add_transition('wait', Move, guard=lambda event: sm.hysteresis(sm.startPoint, event), to='drag')
+        sm.add_transition('wait', Move, guard=sm.hysteresis, to='drag')
         sm.add_transition('drag', Move)
         sm.add_transition('drag', Release, 'Button1', to='start')
         
@@ -405,29 +709,10 @@ class HybridSMTest(unittest.TestCase):
              'transition on Release with Button1 to state start'
             ])
         
-        sm.process_event(Press('Button1', 10, 10))
-        self.assertEqual(sm._sm_current_state, sm.find_state('wait'))
-        
-        sm.process_event(Move(12, 10))
-        self.assertEqual(sm._sm_current_state, sm.find_state('wait'))
-        
-        sm.process_event(Move(14, 14))
-        self.assertEqual(sm._sm_current_state, sm.find_state('wait'))
-        
-        sm.process_event(Move(16, 14))
-        self.assertEqual(sm._sm_current_state, sm.find_state('drag'))
-        
-        sm.process_event(Move(20, 16))
-        self.assertEqual(sm._sm_current_state, sm.find_state('drag'))
-        
-        sm.process_event(Release('Button2', 16, 16))
-        self.assertEqual(sm._sm_current_state, sm.find_state('drag'))
-        
-        sm.process_event(Release('Button1', 16, 16))
-        self.assertEqual(sm._sm_current_state, sm.find_state('start'))
+        checkDragSequence(self, sm)
         
-        print 'Done testHybridSM'
-        print
+        print('Done testHybridSM')
+        print()
 
 if __name__ == "__main__":
     unittest.main()